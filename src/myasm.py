@@ -1,160 +1,211 @@
+from __future__ import annotations
+
+import argparse
 import serial
 import sys
 import time
+from array import array
+from collections.abc import Iterable, Iterator
+from itertools import islice
 
 # 16-bit ISA Instruction encoding
 # Format: [Op:2][Mod:6][Src:4][Dst:4]
 
-def assemble_line(line):
+def _prefix(opcode, mod):
+    """Fixed [Op:2][Mod:6] bits of an instruction word"""
+    return (opcode << 14) | (mod << 8)
+
+# Mnemonic -> (prefix, operand kind)
+#   'rr': OP rX, rY    -> [op][mod][src:4][dst:4]
+#   'ri': OP rX, imm4  -> [op][mod][imm4:4][dst:4]
+#   'r_': OP rX        -> [op][mod][0000][dst:4]
+OPS = {
+    'MOV':  (_prefix(0b00, 0b000000), 'rr'),
+    'ADD':  (_prefix(0b00, 0b000001), 'rr'),
+    'XOR':  (_prefix(0b00, 0b000101), 'rr'),
+    'ADDI': (_prefix(0b00, 0b010000), 'ri'),
+    'PUSH': (_prefix(0b01, 0b000010), 'r_'),
+    'POP':  (_prefix(0b01, 0b000011), 'r_'),
+}
+
+# Register name -> number (r0-r15, also zero-padded r00-r09)
+REG = {f'R{i}': i for i in range(16)}
+REG.update({f'R{i:02d}': i for i in range(10)})
+
+def assemble_line(line: str) -> int | None:
     """Convert one assembly line to 16-bit instruction"""
-    line = line.strip().upper()
+    line = line.strip()
 
     # Skip empty lines and comments
-    if not line or line.startswith('#') or line.startswith(';'):
+    if not line or line[0] in '#;':
         return None
 
-    parts = line.replace(',', ' ').split()
+    # Drop any inline comment, then split on whitespace and commas
+    parts = line.split('#', 1)[0].split(';', 1)[0].upper().replace(',', ' ').split()
     op = parts[0]
 
-    if op == 'MOV':
-        # MOV rX, rY -> [00][000000][src:4][dst:4]
-        dst_str = parts[1][1:]
-        src_str = parts[2][1:]
-        dst = int(dst_str)
-        src = int(src_str)
-        if dst > 15 or src > 15:
-            raise ValueError(f"Invalid MOV: dst={dst}, src={src}")
-
-        opcode = 0b00
-        mod = 0b000000  # MOV encoding
-
-        instruction = (opcode << 14) | (mod << 8) | (src << 4) | dst
-        return instruction
-
-    elif op == 'ADD':
-        # ADD rX, rY -> [00][000001][src:4][dst:4]
-        dst_str = parts[1][1:]
-        src_str = parts[2][1:]
-        dst = int(dst_str)
-        src = int(src_str)
-        if dst > 15 or src > 15:
-            raise ValueError(f"Invalid ADD: dst={dst}, src={src}")
-
-        opcode = 0b00
-        mod = 0b000001  # ADD encoding
-
-        instruction = (opcode << 14) | (mod << 8) | (src << 4) | dst
-        return instruction
-
-    elif op == 'XOR':
-        # XOR rX, rY -> [00][000101][src:4][dst:4]
-        dst_str = parts[1][1:]
-        src_str = parts[2][1:]
-        dst = int(dst_str)
-        src = int(src_str)
-        if dst > 15 or src > 15:
-            raise ValueError(f"Invalid XOR: dst={dst}, src={src}")
-
-        opcode = 0b00
-        mod = 0b000101  # XOR encoding
-
-        instruction = (opcode << 14) | (mod << 8) | (src << 4) | dst
-        return instruction
-
-    elif op == 'ADDI':
-        # ADDI rX, imm4 -> [00][010000][imm4:4][dst:4]
-        dst_str = parts[1][1:]
-        dst = int(dst_str)
-        imm = int(parts[2], 0)  # Support 0x hex or decimal
-        if dst > 15 or imm > 15:
-            raise ValueError(f"Invalid ADDI: dst={dst}, imm={imm}")
-
-        opcode = 0b00
-        mod = 0b010000  # ADDI encoding
-        src = imm       # Immediate in src field
-
-        instruction = (opcode << 14) | (mod << 8) | (src << 4) | dst
-        return instruction
-
-    elif op == 'PUSH':
-        # PUSH rX -> [01][000010][0000][dst:4]
-        reg_str = parts[1][1:]
-        reg = int(reg_str)
-        if reg > 15:
-            raise ValueError(f"Invalid PUSH: reg={reg}")
-
-        opcode = 0b01
-        mod = 0b000010  # PUSH encoding
-        src = 0b0000    # Unused
-        dst = reg
-
-        instruction = (opcode << 14) | (mod << 8) | (src << 4) | dst
-        return instruction
-
-    elif op == 'POP':
-        # POP rX -> [01][000011][0000][dst:4]
-        reg_str = parts[1][1:]
-        reg = int(reg_str)
-        if reg > 15:
-            raise ValueError(f"Invalid POP: reg={reg}")
-
-        opcode = 0b01
-        mod = 0b000011  # POP encoding
-        src = 0b0000    # Unused
-        dst = reg
-
-        instruction = (opcode << 14) | (mod << 8) | (src << 4) | dst
-        return instruction
-
-    else:
-        raise ValueError(f"Unknown instruction: {op}")
-
-def assemble_file(filename):
-    """Assemble entire file to 16-bit instructions"""
-    instructions = []
+    try:
+        prefix, kind = OPS[op]
+    except KeyError:
+        raise ValueError(f"Unknown instruction: {op}") from None
+
+    try:
+        dst = REG[parts[1]]
+        if kind == 'rr':
+            src = REG[parts[2]]
+        elif kind == 'ri':
+            imm = parts[2]
+            # Support 0x hex or decimal; plain decimal skips base detection
+            src = int(imm) if imm.isdigit() else int(imm, 0)
+            if src & ~0xF:  # Also rejects negatives
+                raise ValueError(f"Invalid {op}: imm={src}")
+        else:
+            src = 0b0000  # Unused
+    except KeyError as e:
+        raise ValueError(f"Invalid {op}: unknown register {e.args[0]}") from None
+    except IndexError:
+        raise ValueError(f"Invalid {op}: missing operand") from None
+
+    return prefix | (src << 4) | dst
+
+class AssemblyError(ValueError):
+    """A source line that failed to assemble"""
+
+    def __init__(self, line_num: int, message: str):
+        super().__init__(f"line {line_num}: {message}")
+        self.line_num = line_num
+        self.message = message
+
+def _print_listing(assembled: list[tuple[int, str]], instructions: array) -> None:
+    """Write the assembly listing to stdout in one call"""
+    sys.stdout.write(''.join(
+        f"Line {line_num}: {line.strip():20s} -> 0x{instruction:04X}\n"
+        for (line_num, line), instruction in zip(assembled, instructions)))
+
+def _assemble_lines(lines: Iterable[str]) -> Iterator[tuple[int, str, int]]:
+    """Yield (line_num, source, instruction) per instruction, raising AssemblyError on a bad line"""
+    for line_num, line in enumerate(lines, 1):
+        try:
+            instruction = assemble_line(line)
+        except Exception as e:
+            raise AssemblyError(line_num, str(e)) from e
+        if instruction is not None:
+            yield line_num, line, instruction
+
+def assemble_file(filename: str, verbose: bool = False) -> array:
+    """Assemble entire file to 16-bit instructions, raising AssemblyError on a bad line"""
     with open(filename, 'r') as f:
-        for line_num, line in enumerate(f, 1):
-            try:
-                instruction = assemble_line(line)
-                if instruction is not None:
-                    instructions.append(instruction)
-                    print(f"Line {line_num}: {line.strip():20s} -> 0x{instruction:04X}")
-            except Exception as e:
-                print(f"Error on line {line_num}: {e}")
-                sys.exit(1)
+        lines = f.readlines()  # Newline-only splits, same numbering as iterating the file
+
+    instructions = array('H')  # Unboxed 16-bit words
+    assembled: list[tuple[int, str]] = []  # (line_num, source) per instruction, formatted once at the end
+    try:
+        for line_num, line, instruction in _assemble_lines(lines):
+            instructions.append(instruction)
+            assembled.append((line_num, line))
+    finally:
+        # On error, the listing shows everything up to the bad line
+        if verbose:
+            _print_listing(assembled, instructions)
     return instructions
 
-def send_to_serial(instructions, port='COM3', baud=115200, delay=0.1):
-    """Send 16-bit instructions to serial port (big-endian: high byte first)"""
-    ser = serial.Serial(port, baud, timeout=1)
+def iter_instructions(lines: Iterable[str]) -> Iterator[int]:
+    """Yield 16-bit instructions as lines are read, raising AssemblyError on a bad line
+
+    Pass an open source file to assemble it lazily; the caller owns the file.
+    """
+    for _, _, instruction in _assemble_lines(lines):
+        yield instruction
+
+# Instructions packed per serial write when streaming from a generator
+SEND_BATCH = 64
+
+def _word_batches(instructions: Iterable[int]) -> Iterator[array]:
+    """Yield array('H') batches to send: an assembled array as one copy, anything else SEND_BATCH at a time"""
+    if isinstance(instructions, array) and instructions.typecode == 'H':
+        if instructions:
+            yield instructions[:]  # Copy, since it is byte-swapped in place
+        return
+    it = iter(instructions)
+    while True:
+        batch = array('H', islice(it, SEND_BATCH))
+        if not batch:
+            return
+        yield batch
+
+def send_to_serial(instructions: Iterable[int], port: str = 'COM3', baud: int = 115200,
+                   chunk: int = 0, rtscts: bool = False, verbose: bool = False) -> None:
+    """Send 16-bit instructions to serial port (big-endian: high byte first)
+
+    An array('H') from assemble_file() goes out in a single write. Other
+    iterables are consumed and written SEND_BATCH at a time, so a
+    generator such as iter_instructions() is assembled while earlier
+    batches drain.
+    """
+    # With rtscts the driver blocks on write while the target holds off CTS
+    ser = serial.Serial(port, baud, timeout=1, rtscts=rtscts)
     time.sleep(0.1)  # Let port stabilize
 
-    print(f"\nSending {len(instructions)} instructions ({len(instructions)*2} bytes) to {port}...")
-    for i, instruction in enumerate(instructions):
-        # Send high byte first, then low byte
-        high_byte = (instruction >> 8) & 0xFF
-        low_byte = instruction & 0xFF
-
-        ser.write(bytes([high_byte]))
-        time.sleep(delay)
-        ser.write(bytes([low_byte]))
-
-        print(f"  [{i}] 0x{instruction:04X} = [0x{high_byte:02X}, 0x{low_byte:02X}]")
-        time.sleep(delay)
-
-    ser.close()
-    print("Done!")
+    print(f"\nSending instructions to {port}...")
+    dump: list[str] = []
+    count = 0
+    try:
+        for wire in _word_batches(instructions):
+            # Formatted before the byte swap, recorded once written
+            lines = [f"  [{i}] 0x{instruction:04X} = [0x{instruction >> 8:02X}, 0x{instruction & 0xFF:02X}]\n"
+                     for i, instruction in enumerate(wire, count)] if verbose else []
+
+            if sys.byteorder == 'little':
+                wire.byteswap()  # Board expects big-endian
+            buf = memoryview(wire).cast('B')
+
+            if chunk:
+                # Paced by FIFO size: let each chunk drain before writing the next
+                for start in range(0, len(buf), chunk):
+                    ser.write(buf[start:start + chunk])
+                    ser.flush()
+            else:
+                ser.write(buf)
+            dump.extend(lines)
+            count += len(wire)
+        ser.flush()
+    finally:
+        ser.close()
+        # Also shown when a streamed line fails: this is what reached the board
+        sys.stdout.write(''.join(dump))
+
+    print(f"Done! Sent {count} instructions ({count*2} bytes)")
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Usage: python myasm.py <program.txt> [COM_port]")
-        sys.exit(1)
-
-    filename = sys.argv[1]
-    port = sys.argv[2] if len(sys.argv) > 2 else 'COM3'
-
-    # Assemble
-    instructions = assemble_file(filename)
-
-    # Send to board
-    send_to_serial(instructions, port)
+    parser = argparse.ArgumentParser(description="Assemble a program and send it to the board")
+    parser.add_argument('program', help="assembly source file")
+    parser.add_argument('port', nargs='?', default='COM3', help="serial port (default: COM3)")
+    parser.add_argument('--chunk', type=int, default=0,
+                        help="bytes per write, waiting for each to drain, e.g. the target's FIFO size (default: 0, one write)")
+    parser.add_argument('--rtscts', action='store_true',
+                        help="enable RTS/CTS hardware flow control (needs CTS wired on the target)")
+    parser.add_argument('--stream', action='store_true',
+                        help="send while assembling; a bad line aborts with the program partly sent, "
+                             "and -v shows only the hex dump")
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="print the assembly listing (not with --stream) and a hex dump of what was sent")
+    args = parser.parse_args()
+    if args.chunk < 0:
+        parser.error("--chunk must not be negative")
+
+    try:
+        if args.stream:
+            # Open the source before the port, so a bad path fails first;
+            # it is assembled and sent in one pass and closed either way
+            with open(args.program, 'r') as source:
+                send_to_serial(iter_instructions(source), args.port, chunk=args.chunk,
+                               rtscts=args.rtscts, verbose=args.verbose)
+        else:
+            # Assemble the whole file before touching the board
+            instructions = assemble_file(args.program, args.verbose)
+
+            # Send to board
+            send_to_serial(instructions, args.port, chunk=args.chunk, rtscts=args.rtscts,
+                           verbose=args.verbose)
+    except AssemblyError as e:
+        sys.exit(f"Error on line {e.line_num}: {e.message}")